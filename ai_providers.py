@@ -1,227 +1,243 @@
 from abc import ABC, abstractmethod
-import anthropic
-import openai
-import requests
+from typing import List, NamedTuple
 from config import Config
-import httpx
 try:
     from importlib import metadata
 except ImportError:
     import importlib_metadata as metadata
 
+# Les SDK (anthropic, openai, requests) ne sont importés qu'à la création du
+# provider qui les utilise : un worker ne charge que celui qu'il sert.
+
+# --- Registre des providers ---
+# Les providers intégrés s'enregistrent avec @register_provider ; un paquet tiers
+# peut en ajouter via le groupe d'entry points 'chronos.providers', par exemple:
+#   [project.entry-points."chronos.providers"]
+#   mistral = "chronos_mistral:MistralProvider"
+ENTRY_POINT_GROUP = 'chronos.providers'
+_PROVIDERS = {}
+
+def register_provider(name: str):
+    """Décorateur enregistrant une classe de provider sous un nom"""
+    def decorator(cls):
+        _PROVIDERS[name.lower()] = cls
+        return cls
+    return decorator
+
+def _load_entry_point(name: str):
+    """Charge (au premier usage seulement) un provider déclaré par entry point"""
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        candidates = entry_points.select(group=ENTRY_POINT_GROUP, name=name)
+    else:
+        candidates = [ep for ep in entry_points.get(ENTRY_POINT_GROUP, []) if ep.name == name]
+    for entry_point in candidates:
+        cls = entry_point.load()
+        _PROVIDERS[name] = cls
+        return cls
+    return None
+
+def available_providers():
+    """Noms des providers intégrés et déclarés par entry point"""
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        declared = entry_points.select(group=ENTRY_POINT_GROUP)
+    else:
+        declared = entry_points.get(ENTRY_POINT_GROUP, [])
+    return sorted(set(_PROVIDERS) | {ep.name for ep in declared})
+
+def is_authentication_error(error: Exception) -> bool:
+    """Erreur d'authentification d'un provider, sans importer son SDK"""
+    status = getattr(error, 'status_code', None)
+    if status is None and getattr(error, 'response', None) is not None:
+        status = getattr(error.response, 'status_code', None)
+    return status == 401 or type(error).__name__ == 'AuthenticationError'
+
 # Helper to mask API keys in logs
 def mask_key(api_key):
     if not api_key or len(api_key) < 8:
         return "<empty_or_short>"
     return f"{api_key[:4]}...{api_key[-4:]}"
 
+# --- Limites des modèles ---
+# (préfixe du nom de modèle, fenêtre de contexte, tokens de sortie max).
+# Un préfixe correspond au nom exact ou suivi d'un '-' (gpt-4 -> gpt-4-0613, mais pas
+# gpt-4.5 ni gpt-4o) ; le premier qui correspond l'emporte : garder les plus spécifiques en tête.
+MODEL_LIMITS = [
+    ('claude-3-7-sonnet', 200000, 64000),
+    ('claude-3-5-sonnet', 200000, 8192),
+    ('claude-3.5-sonnet', 200000, 8192),
+    ('claude-3-5-haiku', 200000, 8192),
+    ('claude-3-opus', 200000, 4096),
+    ('claude-3-sonnet', 200000, 4096),
+    ('claude-3-haiku', 200000, 4096),
+    ('gpt-4.1', 1047576, 32768),
+    ('gpt-4o-mini', 128000, 16384),
+    ('gpt-4o', 128000, 16384),
+    ('gpt-4-turbo', 128000, 4096),
+    ('gpt-4-0125', 128000, 4096),
+    ('gpt-4-1106', 128000, 4096),
+    ('gpt-4-32k', 32768, 4096),
+    ('gpt-4', 8192, 4096),
+    ('gpt-3.5-turbo', 16385, 4096),
+]
+# Modèle absent de la table : fenêtre de contexte inconnue (c'est l'API qui la fera
+# respecter) et max_tokens prudent, complété au besoin par les continuations
+DEFAULT_MODEL_LIMITS = (None, 4096)
+# Plafond par appel non streamé : au-delà, une génération peut dépasser le timeout
+# du SDK (600 s) et tout serait perdu ; les continuations prennent le relais
+MAX_TOKENS_PER_CALL = 16000
+# Estimation grossière : ~3 caractères par token pour du français
+CHARS_PER_TOKEN = 3
+# Marge de sécurité pour l'erreur d'estimation des tokens d'entrée
+TOKEN_SAFETY_MARGIN = 1024
+MAX_CONTINUATIONS = 4
+
+CONTINUE_PROMPT = ("Ta réponse précédente a été tronquée. Continue exactement là où tu t'es arrêté, "
+                   "sans répéter ce qui a déjà été écrit et sans commentaire.")
+
+def get_model_limits(model: str):
+    """Retourne (fenêtre de contexte ou None si inconnue, tokens de sortie max) pour un modèle"""
+    # OpenRouter préfixe les modèles par le fournisseur (anthropic/claude-3-opus...)
+    name = model.lower().split('/')[-1]
+    for prefix, context_window, max_output in MODEL_LIMITS:
+        if name == prefix or name.startswith(prefix + '-'):
+            return context_window, max_output
+    return DEFAULT_MODEL_LIMITS
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class Completion(NamedTuple):
+    text: str
+    stop_reason: str
+    truncated: bool
+    continuations: int = 0
+
 class AIProvider(ABC):
+    model: str
+
     @abstractmethod
-    def analyze_text(self, text: str, additional_info: str = "") -> str:
+    def complete(self, messages: List[dict], max_tokens: int) -> Completion:
+        """Un appel unique au modèle ; doit signaler si la sortie a été tronquée"""
         pass
 
+    def max_tokens_for(self, messages: List[dict]) -> int:
+        """Dimensionne max_tokens d'après les limites réelles du modèle et la taille de l'entrée"""
+        context_window, max_output = get_model_limits(self.model)
+        max_tokens = min(max_output, MAX_TOKENS_PER_CALL)
+        if context_window is None:
+            return max_tokens
+        input_tokens = sum(estimate_tokens(m['content']) for m in messages)
+        available = context_window - input_tokens - TOKEN_SAFETY_MARGIN
+        if available <= 0:
+            raise ValueError(f"Le document dépasse la fenêtre de contexte du modèle {self.model} "
+                             f"(~{input_tokens} tokens estimés pour {context_window}).")
+        return min(max_tokens, available)
+
+    def resume_point(self, partial: str) -> str:
+        """Texte partiel tel qu'il est renvoyé au modèle ; la suite y est concaténée"""
+        return partial
+
+    def continuation_messages(self, prompt: str, partial: str) -> List[dict]:
+        """Messages permettant de reprendre une réponse tronquée"""
+        return [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": partial},
+            {"role": "user", "content": CONTINUE_PROMPT},
+        ]
+
+    def generate(self, prompt: str) -> Completion:
+        """Génère une réponse complète, en reprenant automatiquement après une troncature"""
+        messages = [{"role": "user", "content": prompt}]
+        completion = self.complete(messages, self.max_tokens_for(messages))
+        text = completion.text
+        continuations = 0
+
+        while completion.truncated and continuations < MAX_CONTINUATIONS:
+            text = self.resume_point(text)
+            messages = self.continuation_messages(prompt, text)
+            try:
+                max_tokens = self.max_tokens_for(messages)
+            except ValueError:
+                # Plus de place dans la fenêtre : on garde la réponse partielle, les
+                # sections manquantes seront redemandées à part
+                print(f"WARN: No room left in the context window of {self.model}, keeping the partial output.")
+                break
+            continuations += 1
+            print(f"--- Output truncated ({completion.stop_reason}), continuation {continuations}/{MAX_CONTINUATIONS} ---")
+            completion = self.complete(messages, max_tokens)
+            text += completion.text
+
+        if completion.truncated:
+            print(f"WARN: Output still truncated after {continuations} continuations.")
+        return Completion(text=text, stop_reason=completion.stop_reason,
+                          truncated=completion.truncated, continuations=continuations)
+
+@register_provider('anthropic')
 class AnthropicProvider(AIProvider):
     # Accept api_key and model during initialization
     def __init__(self, api_key: str, model: str):
-        # Removed debug prints
+        import anthropic
         self.api_key = api_key 
         self.model = model
         self.client = anthropic.Anthropic(api_key=self.api_key)
 
-    def analyze_text(self, text: str, additional_info: str = "") -> str:
-        # Removed debug print
-        prompt = f"""Analyse le cahier des charges suivant et génère les artefacts de projet demandés.
-        
-        Texte du cahier des charges:
-        {text}
-        
-        Informations supplémentaires:
-        {additional_info}
-        
-        Génère une analyse complète avec les sections suivantes:
-        1. Charte de projet
-        2. Backlog produit
-        3. Estimation d'effort
-        4. Roadmap
-        5. Méthodologie
-        6. Gestion des risques
-        
-        Format de sortie attendu:
-        <output>
-        <project_charter>
-        # Charte de Projet
-        ...
-        </project_charter>
-        
-        <product_backlog>
-        # Backlog Produit
-        ...
-        </product_backlog>
-        
-        <effort_estimation>
-        # Estimation de l'Effort
-        ...
-        </effort_estimation>
-        
-        <roadmap>
-        # Roadmap
-        ...
-        </roadmap>
-        
-        <methodology>
-        # Méthodologie
-        ...
-        </methodology>
-        
-        <risk_management>
-        # Gestion des Risques
-        ...
-        </risk_management>
-        </output>
-        """
+    def resume_point(self, partial: str) -> str:
+        # Un message assistant pré-rempli ne doit pas se terminer par des espaces
+        return partial.rstrip()
+
+    def continuation_messages(self, prompt: str, partial: str) -> List[dict]:
+        # Anthropic reprend directement à partir d'un message assistant pré-rempli
+        return [
+            {"role": "user", "content": prompt},
+            {"role": "assistant", "content": partial},
+        ]
 
+    def complete(self, messages: List[dict], max_tokens: int) -> Completion:
         response = self.client.messages.create(
             model=self.model,
-            max_tokens=8000,
+            max_tokens=max_tokens,
             temperature=0.7,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+            messages=messages
         )
         
-        return response.content[0].text
+        text = "".join(block.text for block in response.content if block.type == "text")
+        return Completion(text=text, stop_reason=response.stop_reason,
+                          truncated=response.stop_reason == "max_tokens")
 
+@register_provider('openai')
 class OpenAIProvider(AIProvider):
     # Accept api_key and model during initialization
     def __init__(self, api_key: str, model: str):
-        # Removed debug prints
+        import openai
         self.api_key = api_key
         self.model = model
         self.client = openai.OpenAI(api_key=self.api_key)
 
-    def analyze_text(self, text: str, additional_info: str = "") -> str:
-        # Removed debug print
-        prompt = f"""Analyse le cahier des charges suivant et génère les artefacts de projet demandés.
-        
-        Texte du cahier des charges:
-        {text}
-        
-        Informations supplémentaires:
-        {additional_info}
-        
-        Génère une analyse complète avec les sections suivantes:
-        1. Charte de projet
-        2. Backlog produit
-        3. Estimation d'effort
-        4. Roadmap
-        5. Méthodologie
-        6. Gestion des risques
-        
-        Format de sortie attendu:
-        <output>
-        <project_charter>
-        # Charte de Projet
-        ...
-        </project_charter>
-        
-        <product_backlog>
-        # Backlog Produit
-        ...
-        </product_backlog>
-        
-        <effort_estimation>
-        # Estimation de l'Effort
-        ...
-        </effort_estimation>
-        
-        <roadmap>
-        # Roadmap
-        ...
-        </roadmap>
-        
-        <methodology>
-        # Méthodologie
-        ...
-        </methodology>
-        
-        <risk_management>
-        # Gestion des Risques
-        ...
-        </risk_management>
-        </output>
-        """
-
+    def complete(self, messages: List[dict], max_tokens: int) -> Completion:
         response = self.client.chat.completions.create(
             model=self.model,
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
+            messages=messages,
             temperature=0.7,
-            max_tokens=4000
+            max_tokens=max_tokens
         )
         
-        return response.choices[0].message.content
+        choice = response.choices[0]
+        return Completion(text=choice.message.content or "", stop_reason=choice.finish_reason,
+                          truncated=choice.finish_reason == "length")
 
+@register_provider('openrouter')
 class OpenRouterProvider(AIProvider):
     # Accept api_key and model during initialization
     def __init__(self, api_key: str, model: str):
-        # Removed debug prints
+        import requests
         self.api_key = api_key 
         self.model = model
         self.api_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.session = requests.Session()
 
-    def analyze_text(self, text: str, additional_info: str = "") -> str:
-        # Removed debug print
-        prompt = f"""Analyse le cahier des charges suivant et génère les artefacts de projet demandés.
-        
-        Texte du cahier des charges:
-        {text}
-        
-        Informations supplémentaires:
-        {additional_info}
-        
-        Génère une analyse complète avec les sections suivantes:
-        1. Charte de projet
-        2. Backlog produit
-        3. Estimation d'effort
-        4. Roadmap
-        5. Méthodologie
-        6. Gestion des risques
-        
-        Format de sortie attendu:
-        <output>
-        <project_charter>
-        # Charte de Projet
-        ...
-        </project_charter>
-        
-        <product_backlog>
-        # Backlog Produit
-        ...
-        </product_backlog>
-        
-        <effort_estimation>
-        # Estimation de l'Effort
-        ...
-        </effort_estimation>
-        
-        <roadmap>
-        # Roadmap
-        ...
-        </roadmap>
-        
-        <methodology>
-        # Méthodologie
-        ...
-        </methodology>
-        
-        <risk_management>
-        # Gestion des Risques
-        ...
-        </risk_management>
-        </output>
-        """
-
+    def complete(self, messages: List[dict], max_tokens: int) -> Completion:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
@@ -229,29 +245,24 @@ class OpenRouterProvider(AIProvider):
 
         data = {
             "model": self.model,
-            "messages": [
-                {"role": "user", "content": prompt}
-            ],
+            "messages": messages,
             "temperature": 0.7,
-            "max_tokens": 4000
+            "max_tokens": max_tokens
         }
 
-        response = requests.post(self.api_url, headers=headers, json=data)
+        response = self.session.post(self.api_url, headers=headers, json=data)
         response.raise_for_status()
         
-        return response.json()["choices"][0]["message"]["content"]
+        choice = response.json()["choices"][0]
+        finish_reason = choice.get("finish_reason") or ""
+        return Completion(text=choice["message"].get("content") or "", stop_reason=finish_reason,
+                          truncated=finish_reason == "length")
 
 # Accept api_key and model as arguments
 def get_provider(provider_name: str, api_key: str, model: str) -> AIProvider:
     """Retourne le provider d'IA approprié selon la configuration"""
     provider_name = provider_name.lower()
-    # Removed debug print
-    
-    if provider_name == 'anthropic':
-        return AnthropicProvider(api_key=api_key, model=model)
-    elif provider_name == 'openai':
-        return OpenAIProvider(api_key=api_key, model=model)
-    elif provider_name == 'openrouter':
-        return OpenRouterProvider(api_key=api_key, model=model)
-    else:
-        raise ValueError(f"Provider d'IA non supporté: {provider_name}") 
\ No newline at end of file
+    provider_class = _PROVIDERS.get(provider_name) or _load_entry_point(provider_name)
+    if provider_class is None:
+        raise ValueError(f"Provider d'IA non supporté: {provider_name}")
+    return provider_class(api_key=api_key, model=model)
@@ -0,0 +1,420 @@
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from array import array
+
+# --- Données structurées des analyses ---
+# Le backlog, les estimations et les risques sont extraits une seule fois du
+# Markdown, au moment de la sauvegarde, en enregistrements compacts (__slots__).
+# Le RecordStore les garde en mémoire avec des index par valeur et des colonnes
+# numériques (array) pour filtrer, trier et agréger sans reparser le Markdown.
+
+RECORDS_FILE = 'records.jsonl'
+
+MARKDOWN_TABLE_PATTERN = r'(\|[^\n]+\|\n\|[-:| ]+\|\n(?:\|[^\n]+\|\n?)+)'
+STORY_PATTERN = re.compile(r'^\s*(?:[-*]|\d+\.)\s*\**(US[-\s]?\d+(?:\.\d+)*)\s*:?\s*\**\s*:?\s*(.+)$', re.IGNORECASE)
+STORY_ID_PATTERN = re.compile(r'US[-\s]?(\d+(?:\.\d+)*)', re.IGNORECASE)
+EPIC_HEADING_PATTERN = re.compile(r'^#{2,4}\s+(?:(?:Epic|Épique|Epique|EP|Module)\s*-?\s*)?(\d+(?:\.\d+)*)\s*[:.\-–]\s*(.+)$',
+                                  re.IGNORECASE)
+SIZE_PATTERN = re.compile(r'\((XS|S|M|L|XL|XXL)\)\s*$')
+EPIC_LABEL_PATTERN = re.compile(r'^(?:(?:Epic|Épique|Epique|EP)\s*-?\s*)?(\d+(?:\.\d+)*)\s*[:.\-–]?\s*(.*)$', re.IGNORECASE)
+PRIORITY_PATTERN = re.compile(r'Priorit[ée]\s*\**\s*:?\s*\**\s*([\wÀ-ÿ-]+)', re.IGNORECASE)
+NUMBER_PATTERN = re.compile(r'-?\d+(?:[.,]\d+)?')
+
+# Niveaux de risque canoniques ; le score numérique est la position dans ce tuple (1 à 4)
+RISK_LEVELS = ('Faible', 'Moyen', 'Élevé', 'Critique')
+# Mots-clés (sans accents, en minuscules) testés dans l'ordre : 'très faible' reste faible
+RISK_LEVEL_KEYWORDS = (('faible', 'Faible'), ('bas', 'Faible'), ('mineur', 'Faible'),
+                       ('critique', 'Critique'), ('tres', 'Critique'),
+                       ('eleve', 'Élevé'), ('haut', 'Élevé'), ('fort', 'Élevé'), ('majeur', 'Élevé'),
+                       ('important', 'Élevé'), ('moyen', 'Moyen'), ('modere', 'Moyen'))
+
+def normalize_story_id(story_id):
+    """'us-2.10' -> 'US2.10'"""
+    match = STORY_ID_PATTERN.search(story_id)
+    return f"US{match.group(1)}" if match else story_id.strip()
+
+def parse_number(cell):
+    """Premier nombre d'une cellule ('1,5 jours' -> 1.5), NaN s'il n'y en a pas"""
+    match = NUMBER_PATTERN.search(cell.replace('*', ''))
+    return float(match.group(0).replace(',', '.')) if match else math.nan
+
+def strip_markdown(cell):
+    return cell.replace('**', '').strip()
+
+def strip_accents(text):
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if not unicodedata.combining(c))
+
+def index_key(value):
+    """Clé d'index : les chaînes sont comparées sans tenir compte de la casse ni des accents"""
+    return strip_accents(value).casefold() if isinstance(value, str) else value
+
+def risk_level(value, scale, product=False):
+    """Niveau canonique d'une probabilité, d'un impact ou (product=True) d'une criticité.
+
+    Un libellé ('Élevée', '3 (moyen)') l'emporte ; sinon la note est rapportée à
+    l'échelle du tableau (1 à scale, ou 1 à scale² pour une criticité = probabilité x impact).
+    """
+    text = strip_accents(value).casefold()
+    for keyword, level in RISK_LEVEL_KEYWORDS:
+        if keyword in text:
+            return level
+    number = parse_number(value)
+    if math.isnan(number) or number <= 0:
+        return ''
+    if product:
+        ratio = number / (scale * scale)
+        thresholds = (0.2, 0.4, 0.64)
+    elif scale == 3:
+        return RISK_LEVELS[min(int(number), 3) - 1]
+    else:
+        ratio = number / scale
+        thresholds = (0.4, 0.6, 0.8)
+    for level, threshold in zip(RISK_LEVELS, thresholds):
+        if ratio <= threshold:
+            return level
+    return RISK_LEVELS[-1]
+
+def risk_score(level):
+    return RISK_LEVELS.index(level) + 1 if level in RISK_LEVELS else math.nan
+
+class Record:
+    """Enregistrement compact ; FIELDS donne l'ordre de sérialisation"""
+    __slots__ = ()
+    FIELDS = ()
+    INDEXED = ()
+    NUMERIC = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.FIELDS, values):
+            setattr(self, field, value)
+
+    def to_row(self):
+        return [getattr(self, field) for field in self.FIELDS]
+
+    def to_dict(self):
+        return {field: (None if isinstance(value, float) and math.isnan(value) else value)
+                for field, value in zip(self.FIELDS, self.to_row())}
+
+class UserStory(Record):
+    __slots__ = ('analysis_id', 'story_id', 'epic', 'title', 'size', 'priority')
+    FIELDS = __slots__
+    INDEXED = ('analysis_id', 'story_id', 'epic', 'size', 'priority')
+
+class Estimate(Record):
+    __slots__ = ('analysis_id', 'story_id', 'epic', 'complexity', 'effort_days')
+    FIELDS = __slots__
+    INDEXED = ('analysis_id', 'story_id', 'epic')
+    NUMERIC = ('complexity', 'effort_days')
+
+class Risk(Record):
+    """Probabilité, impact et criticité sont des niveaux de RISK_LEVELS ; score = niveau de criticité (1 à 4)"""
+    __slots__ = ('analysis_id', 'risk_id', 'description', 'probability', 'impact', 'criticality', 'score',
+                 'mitigation')
+    FIELDS = __slots__
+    INDEXED = ('analysis_id', 'probability', 'impact', 'criticality')
+    NUMERIC = ('score',)
+
+RECORD_TYPES = {'stories': UserStory, 'estimates': Estimate, 'risks': Risk}
+
+# --- Parsing du Markdown ---
+
+def iter_markdown_tables(text):
+    """Retourne (en-têtes, lignes) pour chaque tableau Markdown du texte"""
+    for match in re.finditer(MARKDOWN_TABLE_PATTERN, text.replace('\r\n', '\n')):
+        lines = [line for line in match.group(1).strip().split('\n') if line.strip()]
+        headers = [strip_markdown(cell).lower() for cell in lines[0].strip().strip('|').split('|')]
+        rows = [[strip_markdown(cell) for cell in line.strip().strip('|').split('|')] for line in lines[2:]]
+        yield headers, rows
+
+def find_column(headers, *keywords, exclude=()):
+    for i, header in enumerate(headers):
+        if any(k in header for k in keywords) and not any(k in header for k in exclude):
+            return i
+    return None
+
+def cell(row, index):
+    return row[index] if index is not None and index < len(row) else ''
+
+def parse_epic_priorities(estimation):
+    """Priorité de chaque épique (par numéro et par nom en minuscules) d'après les tableaux par épique"""
+    priorities = {}
+    for headers, rows in iter_markdown_tables(estimation):
+        priority_col = find_column(headers, 'priorit')
+        epic_col = find_column(headers, 'épique', 'epique', 'epic', 'module')
+        if priority_col is None or epic_col is None:
+            continue
+        name_col = find_column(headers, 'description')
+        for row in rows:
+            priority = cell(row, priority_col).capitalize()
+            if not priority or priority == '-':
+                continue
+            label = cell(row, epic_col)
+            numbered = EPIC_LABEL_PATTERN.match(label)
+            if numbered:
+                priorities[numbered.group(1)] = priority
+                # Numéro seul dans la colonne épique : le nom est dans la description
+                label = numbered.group(2) or cell(row, name_col)
+            if label:
+                priorities[label.casefold()] = priority
+    return priorities
+
+def parse_user_stories(analysis_id, backlog, epic_priorities=None):
+    """User stories du backlog, avec leur épique, taille et priorité.
+
+    Une story sans priorité propre reprend celle de son épique (epic_priorities).
+    """
+    stories = []
+    epic_numbers = []
+    epics_by_number = {}
+    current_epic = ''
+    current_epic_number = ''
+    current = None
+
+    for line in backlog.replace('\r\n', '\n').split('\n'):
+        heading = EPIC_HEADING_PATTERN.match(line.strip())
+        if heading:
+            current_epic = strip_markdown(heading.group(2))
+            current_epic_number = heading.group(1)
+            epics_by_number[current_epic_number] = current_epic
+            continue
+
+        match = STORY_PATTERN.match(line)
+        if match:
+            story_id = normalize_story_id(match.group(1))
+            title = strip_markdown(match.group(2))
+            size_match = SIZE_PATTERN.search(title)
+            size = size_match.group(1) if size_match else ''
+            if size_match:
+                title = title[:size_match.start()].strip()
+            epic_number = current_epic_number if current_epic else story_id[2:].split('.')[0]
+            epic = current_epic or epics_by_number.get(epic_number, '')
+            current = UserStory(analysis_id, story_id, epic, title, size, '')
+            stories.append(current)
+            epic_numbers.append(epic_number)
+
+        # La priorité peut figurer sur la ligne de la story ou sur ses sous-lignes
+        priority = PRIORITY_PATTERN.search(line)
+        if current is not None and priority and not current.priority:
+            current.priority = priority.group(1).capitalize()
+
+    if epic_priorities:
+        for story, epic_number in zip(stories, epic_numbers):
+            if not story.priority:
+                story.priority = epic_priorities.get(epic_number) or epic_priorities.get(story.epic.casefold(), '')
+    return stories
+
+def parse_estimates(analysis_id, estimation, stories):
+    """Estimations par user story (les tableaux par épique sont ignorés pour ne pas compter deux fois)"""
+    epic_by_story = {story.story_id: story.epic for story in stories}
+    estimates = {}
+    for headers, rows in iter_markdown_tables(estimation):
+        effort_col = find_column(headers, 'effort', 'jour', 'jh', 'durée', 'heure')
+        complexity_col = find_column(headers, 'complexité', 'point', '(sp)', 'estimation', exclude=('effort', 'jour'))
+        if effort_col is None and complexity_col is None:
+            continue
+        # Effort exprimé en heures : converti en jours de 8h
+        in_hours = effort_col is not None and 'heure' in headers[effort_col]
+        for row in rows:
+            if not row or not STORY_ID_PATTERN.match(row[0]):
+                continue
+            story_id = normalize_story_id(row[0])
+            effort = parse_number(cell(row, effort_col))
+            if in_hours:
+                effort /= 8
+            estimates[story_id] = Estimate(analysis_id, story_id, epic_by_story.get(story_id, ''),
+                                           parse_number(cell(row, complexity_col)), effort)
+    return list(estimates.values())
+
+def parse_risks(analysis_id, risk_management):
+    """Risques des tableaux de la section gestion des risques, niveaux normalisés"""
+    risks = []
+    for headers, rows in iter_markdown_tables(risk_management):
+        description_col = find_column(headers, 'risque', 'description')
+        probability_col = find_column(headers, 'probabilit')
+        if description_col is None or probability_col is None:
+            continue
+        impact_col = find_column(headers, 'impact')
+        criticality_col = find_column(headers, 'criticit', 'niveau')
+        id_col = next((i for i, header in enumerate(headers) if header in ('id', '#', 'n°')), None)
+        # Notes chiffrées : échelle de 1 à 3 ou de 1 à 5 selon la plus haute note du tableau
+        notes = [parse_number(cell(row, col)) for row in rows for col in (probability_col, impact_col)]
+        scale = 3 if max((n for n in notes if not math.isnan(n)), default=5) <= 3 else 5
+        for row in rows:
+            description = cell(row, description_col)
+            if not description:
+                continue
+            criticality = risk_level(cell(row, criticality_col), scale, product=True)
+            risks.append(Risk(analysis_id,
+                              cell(row, id_col),
+                              description,
+                              risk_level(cell(row, probability_col), scale),
+                              risk_level(cell(row, impact_col), scale),
+                              criticality,
+                              risk_score(criticality),
+                              cell(row, find_column(headers, 'mitigation', 'stratégie'))))
+    return risks
+
+def parse_analysis(analysis_id, sections):
+    """Extrait les enregistrements structurés des sections d'une analyse"""
+    estimation = sections.get('effort_estimation', '')
+    stories = parse_user_stories(analysis_id, sections.get('product_backlog', ''), parse_epic_priorities(estimation))
+    return {
+        'stories': stories,
+        'estimates': parse_estimates(analysis_id, estimation, stories),
+        'risks': parse_risks(analysis_id, sections.get('risk_management', '')),
+    }
+
+# --- Stockage indexé ---
+
+class RecordTable:
+    """Enregistrements d'un type, indexés par valeur et avec colonnes numériques"""
+
+    def __init__(self, record_type):
+        self.record_type = record_type
+        self.rows = []
+        self.indexes = {field: {} for field in record_type.INDEXED}
+        self.columns = {field: array('d') for field in record_type.NUMERIC}
+
+    def add(self, record):
+        position = len(self.rows)
+        self.rows.append(record)
+        for field, index in self.indexes.items():
+            index.setdefault(index_key(getattr(record, field)), []).append(position)
+        for field, column in self.columns.items():
+            column.append(getattr(record, field))
+
+    def select(self, filters):
+        """Positions correspondant aux filtres {champ: valeur} et {min_/max_champ: nombre}.
+
+        Un champ numérique filtré par valeur doit être égal au nombre donné.
+        """
+        positions = None
+        for field, value in filters.items():
+            if field in self.indexes:
+                matching = self.indexes[field].get(index_key(value), [])
+                positions = set(matching) if positions is None else positions.intersection(matching)
+
+        candidates = range(len(self.rows)) if positions is None else sorted(positions)
+        selected = []
+        for position in candidates:
+            record = self.rows[position]
+            keep = True
+            for field, value in filters.items():
+                if field in self.indexes:
+                    continue
+                if field.startswith(('min_', 'max_')) and field[4:] in self.columns:
+                    number = self.columns[field[4:]][position]
+                    keep = not math.isnan(number) and (number >= value if field.startswith('min_') else number <= value)
+                elif field in self.columns:
+                    # NaN n'est égal à rien : une valeur manquante ne correspond jamais
+                    keep = self.columns[field][position] == value
+                elif field in self.record_type.FIELDS:
+                    keep = value.lower() in str(getattr(record, field)).lower()
+                if not keep:
+                    break
+            if keep:
+                selected.append(position)
+        return selected
+
+    def aggregate(self, positions):
+        """Nombre d'enregistrements et sommes des colonnes numériques"""
+        result = {'count': len(positions)}
+        for field, column in self.columns.items():
+            values = [column[p] for p in positions if not math.isnan(column[p])]
+            result[f'sum_{field}'] = round(sum(values), 2)
+        return result
+
+class RecordStore:
+    """Tables en mémoire, persistées en ajout seul dans results/records.jsonl (une ligne par analyse)"""
+
+    def __init__(self, results_folder):
+        self.records_path = os.path.join(results_folder, RECORDS_FILE)
+        self._lock = threading.Lock()
+        self._offset = 0
+        self.analysis_ids = set()
+        self.tables = {kind: RecordTable(record_type) for kind, record_type in RECORD_TYPES.items()}
+
+    def _insert(self, entry):
+        if entry['id'] in self.analysis_ids:
+            return
+        # Ligne écrite avec d'autres champs (ancienne version) : ignorée, `index-records` la réextrait
+        for kind, record_type in RECORD_TYPES.items():
+            if any(len(row) != len(record_type.FIELDS) - 1 for row in entry.get(kind, [])):
+                print(f"Skipping outdated records of analysis {entry['id']}, run `flask index-records`")
+                return
+        self.analysis_ids.add(entry['id'])
+        for kind, record_type in RECORD_TYPES.items():
+            for row in entry.get(kind, []):
+                values = [entry['id']] + [math.nan if v is None else v for v in row]
+                self.tables[kind].add(record_type(*values))
+
+    def refresh(self):
+        """Charge les analyses ajoutées au fichier depuis la dernière lecture"""
+        with self._lock:
+            if not os.path.exists(self.records_path) or os.path.getsize(self.records_path) <= self._offset:
+                return
+            with open(self.records_path, 'rb') as f:
+                f.seek(self._offset)
+                for line in iter(f.readline, b''):
+                    if not line.endswith(b'\n'):
+                        break  # Ligne en cours d'écriture par un autre worker
+                    try:
+                        self._insert(json.loads(line.decode('utf-8')))
+                    except (UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError) as e:
+                        print(f"Error loading analysis records: {e}")
+                    self._offset = f.tell()
+
+    def clear(self):
+        """Supprime tous les enregistrements, pour les réextraire"""
+        with self._lock:
+            if os.path.exists(self.records_path):
+                os.remove(self.records_path)
+            self._offset = 0
+            self.analysis_ids = set()
+            self.tables = {kind: RecordTable(record_type) for kind, record_type in RECORD_TYPES.items()}
+
+    def add(self, analysis_id, records):
+        """Ajoute les enregistrements d'une analyse (sans l'identifiant, répété sur chaque ligne)"""
+        entry = {'id': analysis_id}
+        for kind, rows in records.items():
+            entry[kind] = [[None if isinstance(v, float) and math.isnan(v) else v for v in row.to_row()[1:]]
+                           for row in rows]
+        with self._lock:
+            with open(self.records_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        self.refresh()
+
+    def query(self, kind, filters, sort=None, limit=None, group_by=None):
+        """Filtre, trie et agrège les enregistrements d'un type"""
+        self.refresh()
+        table = self.tables[kind]
+        with self._lock:
+            positions = table.select(filters)
+            response = {'totals': table.aggregate(positions)}
+
+            if group_by:
+                groups = {}
+                for position in positions:
+                    groups.setdefault(getattr(table.rows[position], group_by), []).append(position)
+                response['groups'] = {str(key): table.aggregate(group) for key, group in groups.items()}
+                return response
+
+            if sort:
+                field = sort.lstrip('-')
+                if field in table.columns:
+                    column = table.columns[field]
+                    # Valeurs manquantes toujours en fin de liste
+                    positions.sort(key=lambda p: (math.isnan(column[p]),
+                                                  0 if math.isnan(column[p]) else
+                                                  (-column[p] if sort.startswith('-') else column[p])))
+                else:
+                    positions.sort(key=lambda p: str(getattr(table.rows[p], field)),
+                                   reverse=sort.startswith('-'))
+            if limit is not None:
+                positions = positions[:limit]
+            response['items'] = [table.rows[p].to_dict() for p in positions]
+            return response
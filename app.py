@@ -1,32 +1,76 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, abort, jsonify
 import os
+import click
 import PyPDF2
 import re
 import json
 import uuid
-import time
 import traceback
 from werkzeug.utils import secure_filename
 from config import Config, save_config_to_json
-from ai_providers import get_provider, AIProvider
-import anthropic
-import openai
+from ai_providers import is_authentication_error, available_providers
+from model_router import (route_and_generate, split_sections, model_stats, get_api_key, get_default_model,
+                          provider_setting_key)
+from similarity_index import SimilarityIndex, compute_signature, has_enough_text
+from analysis_records import RecordStore, RECORD_TYPES, parse_analysis
+from static_assets import (DIST_DIR, ONE_YEAR, build_assets, vendor_assets,
+                           load_manifest, negotiate_encoding, guess_mimetype)
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# Cache buster pour les fichiers statiques
-app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
-app.config['CACHE_BUSTER'] = int(time.time())
-
 # Créer les dossiers nécessaires s'ils n'existent pas
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['RESULTS_FOLDER'], exist_ok=True)
 
-# Injecter le cache buster dans les templates
+# Index des documents déjà analysés, pour proposer la réutilisation d'une analyse
+similarity_index = SimilarityIndex(app.config['RESULTS_FOLDER'])
+
+# Backlog, estimations et risques structurés de toutes les analyses
+record_store = RecordStore(app.config['RESULTS_FOLDER'])
+
+# Manifest des assets fingerprintés (généré par `flask build-assets`)
+app.config['ASSET_MANIFEST'] = load_manifest(app.static_folder)
+
+def asset_url(path):
+    """URL d'un fichier statique : version fingerprintée si elle a été buildée, fichier local sinon"""
+    built_path = app.config['ASSET_MANIFEST'].get(path)
+    if built_path:
+        return url_for('built_asset', filename=built_path)
+    return url_for('static', filename=path)
+
+# Injecter le helper d'assets dans les templates
 @app.context_processor
-def inject_cache_buster():
-    return {'cache_buster': app.config['CACHE_BUSTER']}
+def inject_asset_url():
+    return {'asset_url': asset_url}
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    """Sert un asset fingerprinté, précompressé si le client l'accepte"""
+    dist_folder = os.path.join(app.static_folder, DIST_DIR)
+    if not os.path.isfile(os.path.join(dist_folder, filename)):
+        abort(404)
+
+    served_file, encoding = negotiate_encoding(dist_folder, filename,
+                                               request.headers.get('Accept-Encoding', ''))
+    response = send_from_directory(dist_folder, served_file,
+                                   mimetype=guess_mimetype(filename), max_age=ONE_YEAR)
+    # Le nom contient le hash du contenu : il ne changera jamais
+    response.headers['Cache-Control'] = f'public, max-age={ONE_YEAR}, immutable'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.cli.command('vendor-assets')
+def vendor_assets_command():
+    """Télécharge les scripts tiers dans static/vendor/"""
+    vendor_assets(app.static_folder)
+
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Génère les assets fingerprintés et précompressés dans static/dist/"""
+    app.config['ASSET_MANIFEST'] = build_assets(app.static_folder)
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
@@ -154,146 +198,120 @@ def format_markdown_text(text):
     
     return text
 
-def analyze_requirements(pdf_content, additional_info=""):
-    """Analyse le cahier des charges en utilisant le provider d'IA configuré, en deux étapes si nécessaire."""
-    provider_name = Config.AI_PROVIDER
-    analysis_result_part1 = None
-    analysis_result_part2 = None
-    
-    try:
-        # --- Configuration Retrieval & Get Provider --- 
-        provider_name = Config.AI_PROVIDER
-        api_key = ''
-        model = ''
-        if provider_name == 'anthropic':
-            api_key = Config.ANTHROPIC_API_KEY
-            model = Config.ANTHROPIC_MODEL
-        elif provider_name == 'openai':
-            api_key = Config.OPENAI_API_KEY
-            model = Config.OPENAI_MODEL
-        elif provider_name == 'openrouter':
-            api_key = Config.OPENROUTER_API_KEY
-            model = Config.OPENROUTER_MODEL
-        
-        if not api_key:
-            raise ValueError(f"Clé API non configurée pour le provider {provider_name}.")
-            
-        provider: AIProvider = get_provider(provider_name=provider_name, api_key=api_key, model=model)
-
-        # --- Appel 1: Sections 1-3 --- 
-        print("--- Calling AI for Part 1 (Charter, Backlog, Estimation) ---")
-        prompt_part1 = f"""Analyse le cahier des charges suivant et génère les 3 premières sections demandées.
+SECTION_NAMES = ['project_charter', 'product_backlog', 'effort_estimation', 'roadmap', 'methodology', 'risk_management']
+SECTION_TITLES = {
+    'project_charter': 'Charte de projet',
+    'product_backlog': 'Backlog produit',
+    'effort_estimation': "Estimation d'effort",
+    'roadmap': 'Roadmap',
+    'methodology': 'Méthodologie',
+    'risk_management': 'Gestion des risques'
+}
+
+def build_sections_prompt(pdf_content, additional_info, sections, previous_analysis="", reference_analysis=""):
+    """Construit le prompt demandant les sections indiquées.
+
+    reference_analysis : analyse d'un document quasi identique, à adapter plutôt qu'à refaire.
+    """
+    requested = "\n        ".join(f"{i}. {SECTION_TITLES[section]} (<{section}>...</{section}>)"
+                                  for i, section in enumerate(sections, 1))
+    expected_format = "\n".join(f"<{section}>\n        ...\n</{section}>" for section in sections)
+    context = ""
+    if previous_analysis:
+        context = f"""
+        Sections déjà générées (pour référence, ne pas les répéter):
+        {previous_analysis}
+        """
+    if reference_analysis:
+        context += f"""
+        Analyse existante d'un cahier des charges quasi identique. Reprends-la et adapte-la
+        uniquement là où le document ci-dessus diffère (noms, dates, périmètre):
+        {reference_analysis}
+        """
+    return f"""Analyse le cahier des charges suivant et génère les sections demandées.
 
         Texte du cahier des charges:
         {pdf_content}
         
         Informations supplémentaires:
         {additional_info}
+        {context}
+        Génère UNIQUEMENT les sections suivantes, en assurant leur cohérence:
+        {requested}
         
-        Génère UNIQUEMENT les sections suivantes:
-        1. Charte de projet (<project_charter>...</project_charter>)
-        2. Backlog produit (<product_backlog>...</product_backlog>)
-        3. Estimation d'effort (<effort_estimation>...</effort_estimation>)
-        
-        Format de sortie attendu (UNIQUEMENT ces 3 sections):
-        <output_part1>
-        <project_charter>
-        ...
-</project_charter>
-<product_backlog>
-        ...
-</product_backlog>
-<effort_estimation>
-        ...
-        </effort_estimation>
-        </output_part1>
-        """
-        analysis_result_part1 = provider.analyze_text(prompt_part1, "")
-        
-        if not analysis_result_part1:
-             raise Exception("Échec de la première partie de l'analyse.")
-        print("--- Part 1 Analysis Received ---")
-
-        # --- Appel 2: Sections 4-6 --- 
-        print("--- Calling AI for Part 2 (Roadmap, Methodology, Risks) ---")
-        prompt_part2 = f"""En te basant sur le cahier des charges original et la première partie de l'analyse fournie ci-dessous, génère les 3 DERNIÈRES sections demandées.
-        
-        Texte du cahier des charges original (pour référence):
-        {pdf_content}
-
-        Informations supplémentaires originales (pour référence):
-        {additional_info}
-
-        Première partie de l'analyse (Charte, Backlog, Estimation):
-        {analysis_result_part1}
-
-        Génère UNIQUEMENT les sections suivantes, en assurant la cohérence avec la première partie:
-        4. Roadmap (<roadmap>...</roadmap>)
-        5. Méthodologie (<methodology>...</methodology>)
-        6. Gestion des risques (<risk_management>...</risk_management>)
-
-        Format de sortie attendu (UNIQUEMENT ces 3 sections):
-        <output_part2>
-<roadmap>
-        ...
-</roadmap>
-<methodology>
-        ...
-</methodology>
-<risk_management>
-        ...
-        </risk_management>
-        </output_part2>
+        Format de sortie attendu (UNIQUEMENT ces sections):
+        <output>
+{expected_format}
+        </output>
         """
-        analysis_result_part2 = provider.analyze_text(prompt_part2, "")
 
-        if not analysis_result_part2:
-             raise Exception("Échec de la deuxième partie de l'analyse.")
-        print("--- Part 2 Analysis Received ---")
-
-        # --- Robust Extraction & Combination --- 
+def extract_sections(text, sections):
+    """Extrait les sections trouvées dans une réponse ; les sections absentes sont ignorées"""
+    found = {}
+    for section in sections:
+        match = re.search(f'<{section}>(.*?)</{section}>', text, re.DOTALL)
+        if match:
+            found[section] = match.group(1).strip()
+    return found
+
+def analyze_requirements(pdf_content, additional_info="", reference_analysis=""):
+    """Analyse le cahier des charges en utilisant le provider d'IA configuré.
+
+    Une seule génération suffit en général : le provider reprend automatiquement
+    les réponses tronquées. Les sections encore manquantes sont redemandées.
+    Chaque appel est routé vers un provider/modèle par model_router, qui peut confier
+    les sections légères (charte, roadmap, méthodologie, risques) à un modèle rapide.
+    Avec reference_analysis, l'analyse d'un document similaire est adaptée.
+    """
+    try:
+        # --- Appel principal: toutes les sections, ou un appel par groupe quand les
+        # sections légères peuvent partir vers un modèle rapide ---
+        full_prompt = build_sections_prompt(pdf_content, additional_info, SECTION_NAMES,
+                                            reference_analysis=reference_analysis)
         sections_content = {}
-        section_names = ['project_charter', 'product_backlog', 'effort_estimation', 'roadmap', 'methodology', 'risk_management']
-        
-        # Extract from Part 1 result
-        for i in range(3):
-            section = section_names[i]
-            pattern = f'<{section}>(.*?)</{section}>'
-            match = re.search(pattern, analysis_result_part1, re.DOTALL)
-            if match:
-                sections_content[section] = match.group(1).strip()
-            else:
-                print(f"WARN: Section '{section}' not found in Part 1 result.")
-                sections_content[section] = "" # Add empty string if not found
-                
-        # Extract from Part 2 result
-        for i in range(3, 6):
-            section = section_names[i]
-            pattern = f'<{section}>(.*?)</{section}>'
-            match = re.search(pattern, analysis_result_part2, re.DOTALL)
-            if match:
-                sections_content[section] = match.group(1).strip()
-            else:
-                print(f"WARN: Section '{section}' not found in Part 2 result.")
-                sections_content[section] = "" # Add empty string if not found
+        for group in split_sections(full_prompt, SECTION_NAMES):
+            print(f"--- Calling AI for sections {group} ---")
+            prompt = full_prompt if group == SECTION_NAMES else build_sections_prompt(
+                pdf_content, additional_info, group, reference_analysis=reference_analysis)
+            completion = route_and_generate(prompt, group)
+            if not completion.text:
+                 raise Exception("Échec de l'analyse.")
+            print(f"--- Analysis Received (stop_reason={completion.stop_reason}, continuations={completion.continuations}) ---")
+            sections_content.update(extract_sections(completion.text, group))
+
+        # --- Rattrapage des sections manquantes (réponse malformée ou toujours tronquée) ---
+        missing = [section for section in SECTION_NAMES if section not in sections_content]
+        if missing:
+            print(f"--- Missing sections {missing}, requesting them ---")
+            previous_analysis = "\n".join(f"<{section}>\n{content}\n</{section}>"
+                                          for section, content in sections_content.items())
+            completion = route_and_generate(build_sections_prompt(pdf_content, additional_info,
+                                                                  missing, previous_analysis), missing)
+            sections_content.update(extract_sections(completion.text, missing))
+
+        for section in SECTION_NAMES:
+            if section not in sections_content:
+                print(f"WARN: Section '{section}' not found in result.")
 
         # Combine extracted sections into the final format
         final_result = "<output>\n"
-        for section in section_names:
+        for section in SECTION_NAMES:
             final_result += f"<{section}>\n{sections_content.get(section, '')}\n</{section}>\n"
         final_result += "</output>"
         
-        print("--- Analysis Parts Extracted and Combined ---")
+        print("--- Analysis Sections Extracted and Combined ---")
         return final_result
 
     except Exception as e:
-        print(f"--- ERROR in analyze_requirements ({provider_name}): {type(e).__name__} - {e} ---")
+        # route_and_generate indique le provider/modèle qui a échoué
+        provider_name, model = getattr(e, 'route', (Config.AI_PROVIDER, get_default_model(Config.AI_PROVIDER)))
+        print(f"--- ERROR in analyze_requirements ({provider_name}:{model}): {type(e).__name__} - {e} ---")
         if isinstance(e, ValueError) and "Clé API non configurée" in str(e):
              flash(str(e))
-        elif isinstance(e, (anthropic.AuthenticationError, openai.AuthenticationError)):
-             flash(f"Erreur d'authentification {provider_name.capitalize()}: Vérifiez votre clé API.")
+        elif is_authentication_error(e):
+             flash(f"Erreur d'authentification {provider_name.capitalize()} ({model}): Vérifiez votre clé API.")
         else:
-             flash(f"Erreur lors de l'analyse ({provider_name}): {str(e)}") 
+             flash(f"Erreur lors de l'analyse ({provider_name}, {model}): {str(e)}") 
         return None
 
 def save_analysis_result(result):
@@ -307,6 +325,9 @@ def save_analysis_result(result):
     # Stocker le résultat et l'ID dans le fichier
     with open(result_file, 'w', encoding='utf-8') as f:
         json.dump({'result': result}, f, ensure_ascii=False)
+
+    # Extraire une fois pour toutes les données structurées (backlog, estimations, risques)
+    record_store.add(result_id, parse_analysis(result_id, extract_analysis_sections(result)))
     
     return result_id
 
@@ -327,10 +348,90 @@ def get_analysis_result(result_id):
         data = json.load(f)
         return data.get('result')
 
+@app.cli.command('index-records')
+@click.option('--rebuild', is_flag=True, help="Réextrait aussi les analyses déjà indexées (serveur arrêté).")
+def index_records_command(rebuild):
+    """Extrait les données structurées des analyses existantes qui n'en ont pas encore"""
+    if rebuild:
+        record_store.clear()
+    record_store.refresh()
+    indexed = 0
+    for name in sorted(os.listdir(app.config['RESULTS_FOLDER'])):
+        result_id, ext = os.path.splitext(name)
+        if ext != '.json' or result_id in record_store.analysis_ids:
+            continue
+        result = get_analysis_result(result_id)
+        if result:
+            record_store.add(result_id, parse_analysis(result_id, extract_analysis_sections(result)))
+            indexed += 1
+    print(f"{indexed} analyses indexed")
+
+@app.route('/api/records/<kind>')
+def query_records(kind):
+    """Filtre, trie et agrège les user stories, estimations ou risques.
+
+    Paramètres : <champ>=valeur, min_<champ>/max_<champ> pour les champs numériques,
+    sort=[-]<champ>, limit=N, group_by=<champ>.
+    """
+    if kind not in RECORD_TYPES:
+        return jsonify({'error': f"Type inconnu: {kind}", 'types': list(RECORD_TYPES)}), 404
+    record_type = RECORD_TYPES[kind]
+
+    filters = {}
+    for key, value in request.args.items():
+        if key in ('sort', 'limit', 'group_by'):
+            continue
+        if key.startswith(('min_', 'max_')) and key[4:] in record_type.NUMERIC:
+            try:
+                filters[key] = float(value)
+            except ValueError:
+                return jsonify({'error': f"Valeur numérique attendue pour {key}"}), 400
+        elif key in record_type.NUMERIC:
+            try:
+                filters[key] = float(value)
+            except ValueError:
+                return jsonify({'error': f"Valeur numérique attendue pour {key}"}), 400
+        elif key in record_type.FIELDS:
+            filters[key] = value
+        else:
+            return jsonify({'error': f"Filtre inconnu: {key}", 'fields': list(record_type.FIELDS)}), 400
+
+    sort = request.args.get('sort')
+    group_by = request.args.get('group_by')
+    for field in (sort.lstrip('-') if sort else None, group_by):
+        if field and field not in record_type.FIELDS:
+            return jsonify({'error': f"Champ inconnu: {field}", 'fields': list(record_type.FIELDS)}), 400
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = -1
+        if limit < 0:
+            return jsonify({'error': "limit doit être un entier positif ou nul"}), 400
+
+    return jsonify(record_store.query(kind, filters, sort=sort, limit=limit, group_by=group_by))
+
+# Providers configurés par des champs dédiés dans config.html
+BUILTIN_PROVIDER_LABELS = {
+    'anthropic': 'Anthropic (Claude)',
+    'openai': 'OpenAI (GPT-4)',
+    'openrouter': 'OpenRouter',
+}
+
+def extra_providers():
+    """Providers déclarés par entry point, sans champs dédiés dans la page de configuration"""
+    return [name for name in available_providers() if name not in BUILTIN_PROVIDER_LABELS]
+
 @app.route('/config')
 def config():
     """Affiche la page de configuration"""
-    return render_template('config.html', title='Configuration', config=Config)
+    extra_provider_settings = {name: {'api_key': get_api_key(name), 'model': get_default_model(name)}
+                               for name in extra_providers()}
+    return render_template('config.html', title='Configuration', config=Config,
+                           providers=available_providers(), provider_labels=BUILTIN_PROVIDER_LABELS,
+                           extra_provider_settings=extra_provider_settings,
+                           model_stats=model_stats.snapshot())
 
 @app.route('/save_config', methods=['POST'])
 def save_config():
@@ -347,6 +448,25 @@ def save_config():
     Config.OPENROUTER_API_KEY = request.form.get('openrouter_api_key', Config._defaults['OPENROUTER_API_KEY'])
     Config.OPENROUTER_MODEL = request.form.get('openrouter_model', Config._defaults['OPENROUTER_MODEL'])
 
+    Config.ROUTING_ENABLED = request.form.get('routing_enabled') == 'on'
+    Config.ROUTING_FAST_MODEL = request.form.get('routing_fast_model', '').strip()
+    Config.ROUTING_LONG_CONTEXT_MODEL = request.form.get('routing_long_context_model', '').strip()
+    for key, field in (('ROUTING_SMALL_INPUT_TOKENS', 'routing_small_input_tokens'),
+                       ('ROUTING_LARGE_INPUT_TOKENS', 'routing_large_input_tokens'),
+                       ('ROUTING_MAX_LATENCY', 'routing_max_latency')):
+        try:
+            setattr(Config, key, int(request.form.get(field, Config._defaults[key])))
+        except ValueError:
+            setattr(Config, key, Config._defaults[key])
+
+    # Providers ajoutés par entry point : mêmes clés <PROVIDER>_API_KEY / <PROVIDER>_MODEL
+    extra_config_data = {}
+    for name in extra_providers():
+        for suffix, field in (('API_KEY', f'{name}_api_key'), ('MODEL', f'{name}_model')):
+            key = provider_setting_key(name, suffix)
+            setattr(Config, key, request.form.get(field, '').strip())
+            extra_config_data[key] = getattr(Config, key)
+
     # --- Sauvegarde persistante en JSON --- 
     current_config_data = {
         'AI_PROVIDER': Config.AI_PROVIDER,
@@ -355,9 +475,17 @@ def save_config():
         'OPENAI_API_KEY': Config.OPENAI_API_KEY,
         'OPENAI_MODEL': Config.OPENAI_MODEL,
         'OPENROUTER_API_KEY': Config.OPENROUTER_API_KEY,
-        'OPENROUTER_MODEL': Config.OPENROUTER_MODEL
+        'OPENROUTER_MODEL': Config.OPENROUTER_MODEL,
+        'ROUTING_ENABLED': Config.ROUTING_ENABLED,
+        'ROUTING_FAST_MODEL': Config.ROUTING_FAST_MODEL,
+        'ROUTING_LONG_CONTEXT_MODEL': Config.ROUTING_LONG_CONTEXT_MODEL,
+        'ROUTING_SMALL_INPUT_TOKENS': Config.ROUTING_SMALL_INPUT_TOKENS,
+        'ROUTING_LARGE_INPUT_TOKENS': Config.ROUTING_LARGE_INPUT_TOKENS,
+        'ROUTING_MAX_LATENCY': Config.ROUTING_MAX_LATENCY,
+        **extra_config_data
     }
     save_config_to_json(current_config_data)
+    Config._loaded_config = current_config_data
     
     flash('Configuration sauvegardée avec succès.') # Message flash mis à jour
     return redirect(url_for('config'))
@@ -396,6 +524,21 @@ def upload_file():
         # Stocker dans la session uniquement les informations essentielles
         session['pdf_text'] = extracted_text
         session['pdf_filename'] = filename
+        # L'analyse affichée jusqu'ici concerne le document précédent
+        session.pop('analysis_id', None)
+
+        # Proposer l'analyse d'un document quasi identique déjà traité
+        session.pop('similar_analysis', None)
+        match = None
+        if has_enough_text(extracted_text):
+            match = similarity_index.find_similar(compute_signature(extracted_text),
+                                                  app.config['SIMILARITY_THRESHOLD'])
+        if match:
+            similar_id, similarity, similar_filename = match
+            session['similar_analysis'] = {'id': similar_id, 'similarity': similarity,
+                                           'filename': similar_filename}
+            flash(f'Document similaire à {similar_filename} ({similarity:.0%}) : '
+                  'vous pouvez réutiliser ou adapter son analyse.')
         
         return redirect(url_for('analyze'))
     else:
@@ -427,7 +570,8 @@ def analyze():
                           title='Analyse du cahier des charges',
                           filename=session['pdf_filename'],
                           text=session['pdf_text'],
-                          analysis_sections=formatted_sections)
+                          analysis_sections=formatted_sections,
+                          similar_analysis=session.get('similar_analysis'))
 
 @app.route('/run_analysis', methods=['POST'])
 def run_analysis():
@@ -436,9 +580,13 @@ def run_analysis():
         return redirect(url_for('home'))
     
     additional_info = request.form.get('additional_info', '')
+
+    # Adapter l'analyse d'un document similaire plutôt que de repartir de zéro
+    reference_analysis = ""
+    if request.form.get('mode') == 'adapt' and 'similar_analysis' in session:
+        reference_analysis = get_analysis_result(session['similar_analysis']['id']) or ""
     
-    # analyze_requirements gère maintenant les deux appels
-    analysis_result = analyze_requirements(session['pdf_text'], additional_info)
+    analysis_result = analyze_requirements(session['pdf_text'], additional_info, reference_analysis)
     
     # --- Log Raw Output (Combined) --- 
     print("\n--- FINAL Combined Analysis Result ---")
@@ -452,11 +600,25 @@ def run_analysis():
     if analysis_result:
         result_id = save_analysis_result(analysis_result)
         session['analysis_id'] = result_id
+        if has_enough_text(session['pdf_text']):
+            similarity_index.add(result_id, compute_signature(session['pdf_text']), session['pdf_filename'])
         flash('Analyse terminée avec succès')
     else:
         pass # Error flash handled in analyze_requirements
     
     return redirect(url_for('analyze'))
 
+@app.route('/reuse_analysis', methods=['POST'])
+def reuse_analysis():
+    """Réutilise telle quelle l'analyse du document similaire détecté à l'upload"""
+    similar = session.get('similar_analysis')
+    if not similar or not get_analysis_result(similar['id']):
+        flash('Aucune analyse similaire disponible')
+        return redirect(url_for('analyze'))
+
+    session['analysis_id'] = similar['id']
+    flash(f"Analyse de {similar['filename']} réutilisée")
+    return redirect(url_for('analyze'))
+
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
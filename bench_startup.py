@@ -0,0 +1,81 @@
+"""Mesure le coût de démarrage d'un worker : temps d'import et mémoire résidente.
+
+Chaque mesure est faite dans un processus Python neuf, comme un worker gunicorn:
+    python bench_startup.py                      # import de app uniquement
+    python bench_startup.py --provider anthropic # + premier usage d'un provider
+    python bench_startup.py --runs 20 --module ai_providers
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+SDK_MODULES = ('anthropic', 'openai', 'requests', 'httpx')
+
+# Exécuté dans le processus enfant : imprime une ligne JSON de mesures
+CHILD_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+import {module}
+import_time = time.perf_counter() - start
+provider_time = None
+if {provider!r}:
+    from ai_providers import get_provider
+    start = time.perf_counter()
+    get_provider({provider!r}, api_key='bench-key', model='bench-model')
+    provider_time = time.perf_counter() - start
+rss_kb = None
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    pass
+if rss_kb is None:
+    # Pas de /proc (macOS) : pic de mémoire via resource, absent sous Windows
+    try:
+        import resource
+        rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            rss_kb //= 1024
+    except ImportError:
+        pass
+print(json.dumps({{
+    'import_time': import_time,
+    'provider_time': provider_time,
+    'rss_kb': rss_kb,
+    'sdks': [m for m in {sdks!r} if m in sys.modules],
+}}))
+"""
+
+def run_once(module, provider):
+    script = CHILD_SCRIPT.format(module=module, provider=provider, sdks=SDK_MODULES)
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help="nombre de processus mesurés")
+    parser.add_argument('--module', default='app', help="module importé au démarrage")
+    parser.add_argument('--provider', default='', help="provider instancié après l'import")
+    args = parser.parse_args()
+
+    results = [run_once(args.module, args.provider) for _ in range(args.runs)]
+
+    import_times = [r['import_time'] * 1000 for r in results]
+    rss = [r['rss_kb'] / 1024 for r in results if r['rss_kb'] is not None]
+    print(f"import {args.module}: median {statistics.median(import_times):.1f} ms "
+          f"(min {min(import_times):.1f}, max {max(import_times):.1f}) over {args.runs} runs")
+    if args.provider:
+        provider_times = [r['provider_time'] * 1000 for r in results]
+        print(f"first use of {args.provider}: median {statistics.median(provider_times):.1f} ms")
+    if rss:
+        print(f"RSS per worker: median {statistics.median(rss):.1f} MiB")
+    else:
+        print("RSS per worker: unavailable on this platform")
+    print(f"SDKs loaded: {', '.join(results[-1]['sdks']) or 'none'}")
+
+if __name__ == '__main__':
+    main()
@@ -35,6 +35,8 @@ class Config:
     RESULTS_FOLDER = 'results'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024
     ALLOWED_EXTENSIONS = {'pdf'}
+    # Similarité (Jaccard estimée) à partir de laquelle une analyse existante est proposée
+    SIMILARITY_THRESHOLD = 0.8
 
     # --- Valeurs par défaut --- (utilisées si rien dans settings.json)
     _defaults = {
@@ -44,7 +46,14 @@ class Config:
         'OPENAI_API_KEY': '',
         'OPENAI_MODEL': 'gpt-4-turbo-preview',
         'OPENROUTER_API_KEY': '',
-        'OPENROUTER_MODEL': 'anthropic/claude-3-opus-20240229'
+        'OPENROUTER_MODEL': 'anthropic/claude-3-opus-20240229',
+        # Routage par appel (voir model_router.py) ; format 'provider:modèle', vide = désactivé
+        'ROUTING_ENABLED': True,
+        'ROUTING_FAST_MODEL': '',
+        'ROUTING_LONG_CONTEXT_MODEL': '',
+        'ROUTING_SMALL_INPUT_TOKENS': 8000,
+        'ROUTING_LARGE_INPUT_TOKENS': 100000,
+        'ROUTING_MAX_LATENCY': 0
     }
 
     # --- Charger depuis JSON et définir les attributs --- 
@@ -57,6 +66,12 @@ class Config:
     OPENAI_MODEL = _loaded_config.get('OPENAI_MODEL', _defaults['OPENAI_MODEL'])
     OPENROUTER_API_KEY = _loaded_config.get('OPENROUTER_API_KEY', _defaults['OPENROUTER_API_KEY'])
     OPENROUTER_MODEL = _loaded_config.get('OPENROUTER_MODEL', _defaults['OPENROUTER_MODEL'])
+    ROUTING_ENABLED = _loaded_config.get('ROUTING_ENABLED', _defaults['ROUTING_ENABLED'])
+    ROUTING_FAST_MODEL = _loaded_config.get('ROUTING_FAST_MODEL', _defaults['ROUTING_FAST_MODEL'])
+    ROUTING_LONG_CONTEXT_MODEL = _loaded_config.get('ROUTING_LONG_CONTEXT_MODEL', _defaults['ROUTING_LONG_CONTEXT_MODEL'])
+    ROUTING_SMALL_INPUT_TOKENS = _loaded_config.get('ROUTING_SMALL_INPUT_TOKENS', _defaults['ROUTING_SMALL_INPUT_TOKENS'])
+    ROUTING_LARGE_INPUT_TOKENS = _loaded_config.get('ROUTING_LARGE_INPUT_TOKENS', _defaults['ROUTING_LARGE_INPUT_TOKENS'])
+    ROUTING_MAX_LATENCY = _loaded_config.get('ROUTING_MAX_LATENCY', _defaults['ROUTING_MAX_LATENCY'])
 
     # Les méthodes supprimées (get_api_key, get_model) restent supprimées
     # @staticmethod
@@ -0,0 +1,224 @@
+import os
+import time
+import threading
+from collections import deque
+from config import Config
+from ai_providers import get_provider, get_model_limits, estimate_tokens, TOKEN_SAFETY_MARGIN, AIProvider
+
+# --- Routage des appels vers un provider/modèle ---
+# Chaque appel est orienté vers un "tier" selon la taille estimée de l'entrée et
+# le type des sections demandées, puis vers le premier candidat en bonne santé
+# (taux d'erreur et latence observés) dont la fenêtre de contexte suffit.
+
+TIER_FAST = 'fast'
+TIER_STANDARD = 'standard'
+TIER_LONG_CONTEXT = 'long_context'
+
+# Sections courtes, qu'un modèle rapide produit correctement
+LIGHT_SECTIONS = {'project_charter', 'roadmap', 'methodology', 'risk_management'}
+
+# Ordre de repli des tiers, selon le tier choisi en premier
+TIER_FALLBACKS = {
+    TIER_FAST: [TIER_FAST, TIER_STANDARD, TIER_LONG_CONTEXT],
+    TIER_STANDARD: [TIER_STANDARD, TIER_LONG_CONTEXT],
+    TIER_LONG_CONTEXT: [TIER_LONG_CONTEXT, TIER_STANDARD],
+}
+
+STATS_WINDOW = 20
+MIN_SAMPLES = 3
+MAX_ERROR_RATE = 0.5
+LATENCY_EWMA_ALPHA = 0.3
+# Délai après lequel un modèle en échec est de nouveau essayé en priorité
+RETRY_AFTER_SECONDS = 300
+
+def provider_setting_key(provider_name, suffix):
+    """'my-provider', 'API_KEY' -> 'MY_PROVIDER_API_KEY'"""
+    return f"{provider_name.upper().replace('-', '_')}_{suffix}"
+
+def get_provider_setting(provider_name, suffix):
+    """Réglage d'un provider : attribut de Config, puis settings.json, puis variable d'environnement.
+
+    Les providers ajoutés par entry point n'ont pas d'attribut dans Config.
+    """
+    key = provider_setting_key(provider_name, suffix)
+    return getattr(Config, key, '') or Config._loaded_config.get(key, '') or os.getenv(key, '')
+
+def get_api_key(provider_name):
+    """Retourne la clé API configurée pour un provider (<PROVIDER>_API_KEY)"""
+    return get_provider_setting(provider_name, 'API_KEY')
+
+def get_default_model(provider_name):
+    """Retourne le modèle configuré pour un provider (<PROVIDER>_MODEL)"""
+    return get_provider_setting(provider_name, 'MODEL')
+
+def parse_route(spec):
+    """'provider:modèle' -> (provider, modèle) ; None si la valeur est vide ou invalide"""
+    if not spec or ':' not in spec:
+        return None
+    provider_name, model = spec.split(':', 1)
+    provider_name, model = provider_name.strip().lower(), model.strip()
+    if not provider_name or not model:
+        return None
+    return provider_name, model
+
+def tier_routes():
+    """Candidats (provider, modèle) de chaque tier, d'après la configuration"""
+    standard = (Config.AI_PROVIDER, get_default_model(Config.AI_PROVIDER))
+    return {
+        TIER_FAST: parse_route(Config.ROUTING_FAST_MODEL),
+        TIER_STANDARD: standard,
+        TIER_LONG_CONTEXT: parse_route(Config.ROUTING_LONG_CONTEXT_MODEL),
+    }
+
+class ModelStats:
+    """Latence et erreurs observées par (provider, modèle), en mémoire"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outcomes = {}
+        self._latency = {}
+        self._last_failure = {}
+        self._last_call = {}
+
+    def record(self, route, latency, success):
+        with self._lock:
+            self._last_call[route] = time.monotonic()
+            self._outcomes.setdefault(route, deque(maxlen=STATS_WINDOW)).append(success)
+            if not success:
+                self._last_failure[route] = time.monotonic()
+            else:
+                previous = self._latency.get(route)
+                self._latency[route] = latency if previous is None else (
+                    LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * previous)
+
+    def error_rate(self, route):
+        with self._lock:
+            outcomes = self._outcomes.get(route)
+            if not outcomes or len(outcomes) < MIN_SAMPLES:
+                return 0.0
+            return outcomes.count(False) / len(outcomes)
+
+    def seconds_since_failure(self, route):
+        with self._lock:
+            last_failure = self._last_failure.get(route)
+            return None if last_failure is None else time.monotonic() - last_failure
+
+    def seconds_since_call(self, route):
+        with self._lock:
+            last_call = self._last_call.get(route)
+            return None if last_call is None else time.monotonic() - last_call
+
+    def latency(self, route):
+        with self._lock:
+            return self._latency.get(route)
+
+    def snapshot(self):
+        with self._lock:
+            return {f"{p}:{m}": {'calls': len(outcomes),
+                                 'errors': outcomes.count(False),
+                                 'latency': self._latency.get((p, m))}
+                    for (p, m), outcomes in self._outcomes.items()}
+
+model_stats = ModelStats()
+
+def choose_tier(input_tokens, sections):
+    """Tier préféré selon la taille de l'entrée et le type de sections"""
+    if input_tokens >= Config.ROUTING_LARGE_INPUT_TOKENS:
+        return TIER_LONG_CONTEXT
+    if input_tokens <= Config.ROUTING_SMALL_INPUT_TOKENS and set(sections) <= LIGHT_SECTIONS:
+        return TIER_FAST
+    # Un petit document reste rapide à traiter, même pour le backlog
+    if input_tokens <= Config.ROUTING_SMALL_INPUT_TOKENS // 2:
+        return TIER_FAST
+    return TIER_STANDARD
+
+def split_sections(prompt, sections):
+    """Regroupe les sections en appels distincts : les sections légères partent vers le tier
+    rapide quand l'ensemble des sections relèverait d'un tier plus lent.
+
+    Chaque appel renvoie le document entier : on ne découpe que si un modèle rapide est configuré.
+    """
+    light = [section for section in sections if section in LIGHT_SECTIONS]
+    heavy = [section for section in sections if section not in LIGHT_SECTIONS]
+    if not Config.ROUTING_ENABLED or not light or not heavy or not tier_routes()[TIER_FAST]:
+        return [list(sections)]
+    input_tokens = estimate_tokens(prompt)
+    if choose_tier(input_tokens, light) != TIER_FAST or choose_tier(input_tokens, sections) == TIER_FAST:
+        return [list(sections)]
+    return [heavy, light]
+
+def is_healthy(route):
+    since_failure = model_stats.seconds_since_failure(route)
+    if model_stats.error_rate(route) > MAX_ERROR_RATE and since_failure < RETRY_AFTER_SECONDS:
+        return False
+    # Un modèle trop lent n'est plus appelé, donc sa latence ne serait jamais remise à jour :
+    # il est de nouveau essayé en priorité RETRY_AFTER_SECONDS après son dernier appel
+    latency = model_stats.latency(route)
+    max_latency = Config.ROUTING_MAX_LATENCY
+    if max_latency and latency is not None and latency > max_latency:
+        return model_stats.seconds_since_call(route) >= RETRY_AFTER_SECONDS
+    return True
+
+def fits_context(route, input_tokens):
+    context_window, _ = get_model_limits(route[1])
+    # Fenêtre inconnue : on laisse l'API trancher
+    return context_window is None or input_tokens + TOKEN_SAFETY_MARGIN < context_window
+
+def plan_routes(prompt, sections):
+    """Retourne les (provider, modèle) candidats, dans l'ordre d'essai"""
+    input_tokens = estimate_tokens(prompt)
+    routes = tier_routes()
+
+    if not Config.ROUTING_ENABLED:
+        tier = TIER_STANDARD
+        candidates = [routes[TIER_STANDARD]]
+    else:
+        tier = choose_tier(input_tokens, sections)
+        candidates = []
+        for fallback_tier in TIER_FALLBACKS[tier]:
+            route = routes[fallback_tier]
+            if not route or route in candidates or not get_api_key(route[0]):
+                continue
+            if not fits_context(route, input_tokens):
+                print(f"--- Routing: {route[0]}:{route[1]} skipped, ~{input_tokens} tokens exceed its context window ---")
+                continue
+            candidates.append(route)
+        # Les candidats en mauvaise santé restent en dernier recours
+        candidates.sort(key=lambda route: not is_healthy(route))
+        if not candidates:
+            candidates = [routes[TIER_STANDARD]]
+
+    print(f"--- Routing: ~{input_tokens} tokens, sections={list(sections)}, tier={tier}, "
+          f"candidates={[f'{p}:{m}' for p, m in candidates]} ---")
+    return candidates
+
+def route_and_generate(prompt, sections):
+    """Génère la réponse via le meilleur candidat, en repliant sur les suivants en cas d'erreur.
+
+    L'exception relevée porte l'attribut route = (provider, modèle) du dernier candidat en échec.
+    """
+    last_error = None
+    for provider_name, model in plan_routes(prompt, sections):
+        api_key = get_api_key(provider_name)
+        if not api_key:
+            error = ValueError(f"Clé API non configurée pour le provider {provider_name}.")
+            error.route = (provider_name, model)
+            raise error
+
+        start = time.monotonic()
+        try:
+            provider: AIProvider = get_provider(provider_name=provider_name, api_key=api_key, model=model)
+            completion = provider.generate(prompt)
+        except Exception as e:
+            model_stats.record((provider_name, model), time.monotonic() - start, success=False)
+            print(f"--- Routing: {provider_name}:{model} failed ({type(e).__name__}), trying next candidate ---")
+            e.route = (provider_name, model)
+            last_error = e
+            continue
+
+        latency = time.monotonic() - start
+        model_stats.record((provider_name, model), latency, success=True)
+        print(f"--- Routing: {provider_name}:{model} answered in {latency:.1f}s ---")
+        return completion
+
+    raise last_error
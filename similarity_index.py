@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from array import array
+
+# --- Détection de documents quasi identiques ---
+# Signature MinHash "one permutation" (un seul hachage par shingle, réparti dans
+# NUM_BINS compartiments) puis index LSH par bandes : une recherche coûte
+# NUM_BANDS accès dictionnaire + la comparaison de quelques signatures,
+# quelle que soit la taille du corpus.
+
+SHINGLE_SIZE = 5
+NUM_BINS = 128
+NUM_BANDS = 16
+ROWS_PER_BAND = NUM_BINS // NUM_BANDS
+HASH_BITS = 64
+EMPTY_BIN = (1 << HASH_BITS) - 1
+# En dessous (PDF scanné sans texte, document vide), la signature ne veut rien dire :
+# tous ces documents se ressembleraient
+MIN_TOKENS = 50
+INDEX_FILE = 'similarity_index.jsonl'
+
+def normalize_tokens(text):
+    """Mots en minuscules ; les chiffres sont neutralisés pour ignorer les dates et références"""
+    return re.findall(r'\w+', re.sub(r'\d', '0', text.lower()))
+
+def has_enough_text(text):
+    """Le document contient-il assez de mots pour être indexé ou comparé ?"""
+    return len(normalize_tokens(text)) >= MIN_TOKENS
+
+def shingle_hashes(text):
+    """Hash 64 bits de chaque shingle de SHINGLE_SIZE mots"""
+    tokens = normalize_tokens(text)
+    hashes = set()
+    for i in range(len(tokens) - SHINGLE_SIZE + 1):
+        shingle = ' '.join(tokens[i:i + SHINGLE_SIZE]).encode('utf-8')
+        hashes.add(int.from_bytes(hashlib.blake2b(shingle, digest_size=8).digest(), 'big'))
+    return hashes
+
+def compute_signature(text):
+    """Signature MinHash (one permutation hashing avec densification par rotation)"""
+    bins = [EMPTY_BIN] * NUM_BINS
+    for h in shingle_hashes(text):
+        b = h % NUM_BINS
+        value = h // NUM_BINS
+        if value < bins[b]:
+            bins[b] = value
+
+    # Densification : un compartiment vide reprend la valeur du suivant non vide
+    if any(v != EMPTY_BIN for v in bins):
+        for b in range(NUM_BINS):
+            offset = 1
+            while bins[b] == EMPTY_BIN:
+                candidate = bins[(b + offset) % NUM_BINS]
+                if candidate != EMPTY_BIN:
+                    bins[b] = candidate + offset
+                offset += 1
+    return bins
+
+def estimate_similarity(signature_a, signature_b):
+    """Estimation de la similarité de Jaccard entre deux documents"""
+    same = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+    return same / NUM_BINS
+
+def band_keys(signature):
+    for band in range(NUM_BANDS):
+        rows = signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND]
+        yield band, hash(tuple(rows))
+
+class SimilarityIndex:
+    """Index LSH en mémoire, persisté en ajout seul dans results/similarity_index.jsonl.
+
+    Chaque worker relit les lignes ajoutées par les autres avant une recherche.
+    Les signatures sont rangées bout à bout dans un seul array('Q') (8 octets par
+    compartiment) et les buckets ne contiennent que des positions.
+    """
+
+    def __init__(self, results_folder):
+        self.index_path = os.path.join(results_folder, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._offset = 0
+        self._positions = {}
+        self._ids = []
+        self._filenames = []
+        self._signatures = array('Q')
+        self._buckets = [{} for _ in range(NUM_BANDS)]
+
+    def _insert(self, entry):
+        result_id = entry['id']
+        signature = entry['signature']
+        if result_id in self._positions or len(signature) != NUM_BINS:
+            return
+        position = len(self._ids)
+        self._signatures.extend(signature)
+        self._positions[result_id] = position
+        self._ids.append(result_id)
+        self._filenames.append(entry.get('filename', ''))
+        for band, key in band_keys(signature):
+            # Un bucket ne contient le plus souvent qu'un document : un int plutôt qu'une liste
+            bucket = self._buckets[band]
+            existing = bucket.get(key)
+            if existing is None:
+                bucket[key] = position
+            elif isinstance(existing, int):
+                bucket[key] = [existing, position]
+            else:
+                existing.append(position)
+
+    def _signature(self, position):
+        return self._signatures[position * NUM_BINS:(position + 1) * NUM_BINS]
+
+    def refresh(self):
+        """Charge les entrées ajoutées au fichier depuis la dernière lecture"""
+        with self._lock:
+            if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) <= self._offset:
+                return
+            with open(self.index_path, 'rb') as f:
+                f.seek(self._offset)
+                for line in iter(f.readline, b''):
+                    if not line.endswith(b'\n'):
+                        break  # Ligne en cours d'écriture par un autre worker
+                    try:
+                        self._insert(json.loads(line.decode('utf-8')))
+                    except (UnicodeDecodeError, json.JSONDecodeError, KeyError, TypeError, OverflowError) as e:
+                        print(f"Error loading similarity index entry: {e}")
+                    self._offset = f.tell()
+
+    def add(self, result_id, signature, filename=''):
+        """Ajoute l'analyse d'un document à l'index"""
+        entry = {'id': result_id, 'filename': filename, 'signature': signature}
+        with self._lock:
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+        self.refresh()
+
+    def find_similar(self, signature, threshold):
+        """Retourne (result_id, similarité, filename) du plus proche document au-dessus du seuil, ou None"""
+        self.refresh()
+        with self._lock:
+            candidates = set()
+            for band, key in band_keys(signature):
+                found = self._buckets[band].get(key)
+                if isinstance(found, int):
+                    candidates.add(found)
+                elif found:
+                    candidates.update(found)
+
+            best = None
+            for position in candidates:
+                similarity = estimate_similarity(signature, self._signature(position))
+                if similarity >= threshold and (best is None or similarity > best[1]):
+                    best = (self._ids[position], similarity, self._filenames[position])
+            return best
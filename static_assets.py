@@ -0,0 +1,127 @@
+import os
+import json
+import gzip
+import hashlib
+import shutil
+import mimetypes
+import urllib.request
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# --- Static Asset Pipeline ---
+# Les fichiers de static/ sont copiés dans static/dist/ sous un nom contenant
+# le hash de leur contenu (style.3f2a9c1b04de.css), accompagnés de variantes
+# .gz et .br précompressées. Le manifest fait la correspondance nom logique -> nom
+# fingerprinté, ce qui permet de servir les fichiers avec un cache "immutable".
+
+DIST_DIR = 'dist'
+MANIFEST_FILE = 'manifest.json'
+HASH_LENGTH = 12
+ONE_YEAR = 365 * 24 * 3600
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.map'}
+
+# Scripts et feuilles de style tiers, vendorisés (et committés) dans static/vendor/.
+# Les URLs ne servent qu'à `flask vendor-assets` pour les mettre à jour.
+VENDOR_ASSETS = {
+    'vendor/bootstrap/bootstrap.min.css': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.8/dist/css/bootstrap.min.css',
+    'vendor/bootstrap/bootstrap.bundle.min.js': 'https://cdn.jsdelivr.net/npm/bootstrap@5.3.8/dist/js/bootstrap.bundle.min.js',
+}
+
+def file_hash(file_path):
+    """Retourne le hash (tronqué) du contenu d'un fichier"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+def fingerprinted_name(logical_path, content_hash):
+    """style.css + 3f2a9c1b04de -> style.3f2a9c1b04de.css"""
+    root, ext = os.path.splitext(logical_path)
+    return f"{root}.{content_hash}{ext}"
+
+def vendor_assets(static_folder):
+    """Télécharge les dépendances tierces dans static/vendor/ (à committer)"""
+    for logical_path, url in VENDOR_ASSETS.items():
+        target = os.path.join(static_folder, logical_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        print(f"Downloading {url} -> {target}")
+        with urllib.request.urlopen(url) as response, open(target, 'wb') as f:
+            shutil.copyfileobj(response, f)
+
+def build_assets(static_folder):
+    """Génère static/dist/ : copies fingerprintées, variantes .gz/.br et manifest"""
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    if os.path.isdir(dist_folder):
+        shutil.rmtree(dist_folder)
+    os.makedirs(dist_folder)
+
+    if brotli is None:
+        print("WARN: module 'brotli' absent, seules les variantes .gz seront générées.")
+
+    manifest = {}
+    for root, dirs, files in os.walk(static_folder):
+        # Ne pas retraiter le dossier de sortie
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_folder]
+        for name in files:
+            source = os.path.join(root, name)
+            logical_path = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            built_path = fingerprinted_name(logical_path, file_hash(source))
+            target = os.path.join(dist_folder, built_path)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                with open(source, 'rb') as f:
+                    content = f.read()
+                # mtime=0 pour que la sortie soit reproductible d'un build à l'autre
+                with open(target + '.gz', 'wb') as f:
+                    f.write(gzip.compress(content, compresslevel=9, mtime=0))
+                if brotli is not None:
+                    with open(target + '.br', 'wb') as f:
+                        f.write(brotli.compress(content, quality=11))
+
+            manifest[logical_path] = built_path
+
+    with open(os.path.join(dist_folder, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    print(f"{len(manifest)} assets written to {dist_folder}")
+    return manifest
+
+def load_manifest(static_folder):
+    """Charge le manifest s'il a été généré, sinon retourne un dict vide"""
+    manifest_path = os.path.join(static_folder, DIST_DIR, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (IOError, json.JSONDecodeError) as e:
+            print(f"Error loading {manifest_path}: {e}")
+    return {}
+
+def negotiate_encoding(dist_folder, filename, accept_encoding):
+    """Choisit la meilleure variante précompressée acceptée par le client.
+
+    Retourne (nom_de_fichier_à_servir, content_encoding ou None).
+    """
+    accepted = set()
+    for token in accept_encoding.split(','):
+        name, _, params = token.partition(';')
+        # 'br;q=0' signifie que l'encodage est refusé
+        q = params.strip().lower()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in accepted and os.path.isfile(os.path.join(dist_folder, filename + suffix)):
+            return filename + suffix, encoding
+    return filename, None
+
+def guess_mimetype(filename):
+    return mimetypes.guess_type(filename)[0] or 'application/octet-stream'